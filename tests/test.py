@@ -6,15 +6,21 @@
 from collections import defaultdict
 from difflib import context_diff
 from functools import cache, cached_property
+from hashlib import blake2b
 from itertools import chain, repeat
+import json
 import logging
 from logging import getLogger
 from math import ceil
-from multiprocessing import Pool, cpu_count
+from multiprocessing import get_all_start_methods, get_context, cpu_count
+from multiprocessing.pool import Pool
+from multiprocessing.util import Finalize
+import os
 from pathlib import Path
-from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, TypeVar
-from shutil import copyfile, rmtree
-from subprocess import CompletedProcess, run
+import re
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, TypeVar
+from shutil import copyfile, copytree, rmtree
+from subprocess import DEVNULL, PIPE, CompletedProcess, run
 import sys
 from tempfile import mkdtemp
 
@@ -28,27 +34,50 @@ import yaml
 # Global variables
 LOGGER = getLogger(__name__)
 
+TEST_OUTPUT_REGEX = re.compile(r'^[^\S\n]*TEST INPUT BEGIN[^\S\n]*\n(.*?)^[^\S\n]*TEST INPUT END[^\S\n]*$', re.DOTALL | re.MULTILINE)
+DOCUMENT_OUTPUT_REGEX = re.compile(r'^[^\S\n]*BEGIN document[^\S\n]*\n.*?^[^\S\n]*END document[^\S\n]*$', re.DOTALL | re.MULTILINE)
+INPUT_DELIMITER_REGEX = re.compile(r'^[^\S\n]*<<<[^\S\n]*$', re.MULTILINE)
+EXPECTED_OUTPUT_DELIMITER_REGEX = re.compile(r'^[^\S\n]*>>>[^\S\n]*$', re.MULTILINE)
+YAML_DELIMITER_REGEX = re.compile(r'^[^\S\n]*---[^\S\n]*$', re.MULTILINE)
+
+BODY_TEXT_CACHE: Dict['BodyTextCacheKey', str] = dict()  # Expanded body templates, see `expand_body_templates()`.
+
 
 # Configuration
 LOG_LEVEL: int = logging.INFO
 
 UPDATE_TESTS: bool = False
 FAIL_FAST: bool = True
+USE_CACHE: bool = True  # Using `False` will rerun tests that succeeded in previous runs and refresh their cached outputs.
 
 NUM_PROCESSES: int = cpu_count()
 MIN_NUM_BATCHES: int = 16  # Using a smaller value will increase batch size, speed, and memory footprint.
 # If `NUM_PROCESSES` > `MIN_NUM_BATCHES`, we will decrease the batch size and create `NUM_PROCESSES` batches.
+MAX_TASKS_PER_CHILD: Optional[int] = None  # Using a smaller value will decrease memory footprint and speed.
+# With a smaller value, worker processes are replaced more often and need to repopulate their caches.
+MAX_NUM_SEQUENTIAL_BATCHES: int = 1  # Using a larger value will run more batches without starting worker processes.
 
 MAX_TESTFILE_NAMES_SHOWN: int = 5
 MAX_TESTFILE_NAMES_SHOWN_COLLAPSED: int = 3
+MAX_DIFF_LINES_SHOWN: int = 200
 
 TEMPLATE_DIRECTORY: Path = Path('templates')
 SUPPORT_DIRECTORY: Path = Path('support')
+TEST_CACHE_DIRECTORY: Optional[Path] = Path('.test-cache')  # Using `None` will disable caching of test outputs across runs.
+TEMPLATE_CACHE_FILE: Optional[Path] = Path('.template-cache.json')  # Using `None` will disable caching of templates across runs.
+
+PACKAGE_FILENAMES: Tuple[str, ...] = (
+    'markdown.lua', 'markdown-tinyyaml.lua', 'markdown.tex', 'markdown.sty', 't-markdown.tex',
+    'markdownthemewitiko_dot.sty', 'markdownthemewitiko_graphicx_http.sty', 'markdownthemewitiko_tilde.tex',
+    'markdownthemewitiko_markdown_defaults.tex', 'markdownthemewitiko_markdown_defaults.sty',
+    't-markdownthemewitiko_markdown_defaults.tex',
+)
 
 COMMANDS_FILENAME = 'COMMANDS.m4'
 TEMPLATE_HEAD_FILENAME: str = 'head.tex'
 TEMPLATE_BODY_FILENAME: str = 'body.tex.m4'
 TEMPLATE_FOOT_FILENAME: str = 'foot.tex'
+TEMPLATE_BODY_SEPARATOR: str = '%%% TEMPLATE BODY SEPARATOR %%%'
 TEST_FILENAME: str = 'test.tex'
 TEST_OUTPUT_FILENAME: str = 'test.log'
 TEST_ACTUAL_OUTPUT_FILENAME: str = 'test-actual.log'
@@ -57,6 +86,7 @@ TEST_SETUP_FILENAME_FORMAT: str = 'test-setup-{:03d}.tex'
 TEST_INPUT_FILENAME_FORMAT: str = 'test-input-{:03d}.md'
 TEST_EXPECTED_OUTPUT_FILENAME_FORMAT: str = 'test-expected-{:03d}.log'
 TEST_ACTUAL_OUTPUT_FILENAME_FORMAT: str = 'test-actual-{:03d}.log'
+TEST_CACHE_FILENAME_FORMAT: str = '{}.log'
 
 
 # Types
@@ -69,14 +99,36 @@ TeXFormat = str
 Template = Path
 Command = Tuple[str, ...]
 
+
+class TeXFormatMetadata(NamedTuple):
+    templates: Tuple[Template, ...]
+    commands: Tuple[Command, ...]
+
+
+TemplateMetadata = Dict[TeXFormat, TeXFormatMetadata]
+
 NegativePriority = int
 
 Metadata = str
 SetupText = str
 InputText = str
 OutputText = str
-OutputTextDiff = str
-OutputTextHeadlessDiff = str
+OutputLines = Tuple[str, ...]
+OutputTextHeadlessDiffDigest = str
+BodyTextCacheKey = Tuple[str, str, str, InputText]
+
+
+class OutputTextDiff(NamedTuple):
+    headless_digest: OutputTextHeadlessDiffDigest  # The digest of the diff without the header with the names of files.
+    shown_lines: Tuple[str, ...]
+    num_lines: int
+
+
+class TestFileFilenames(NamedTuple):
+    setup_filename: str
+    input_filename: str
+    expected_output_filename: str
+    actual_output_filename: str
 
 
 class ReadTestFile(NamedTuple):
@@ -84,6 +136,7 @@ class ReadTestFile(NamedTuple):
     setup_text: SetupText
     input_text: InputText
     expected_output_text: OutputText
+    expected_output_lines: OutputLines
 
 
 ReadTestFiles = List[ReadTestFile]
@@ -137,6 +190,11 @@ class TestSubResult:
         expected_output_text = self.read_test_file.expected_output_text
         return expected_output_text
 
+    @property
+    def expected_output_lines(self) -> OutputLines:
+        expected_output_lines = self.read_test_file.expected_output_lines
+        return expected_output_lines
+
     @property
     def actual_output_text(self) -> OutputText:
         try:
@@ -145,37 +203,55 @@ class TestSubResult:
         except IndexError:
             return ''  # We have already deleted temporary directory, or no output was produced due to an error.
 
+    @property
+    def actual_output_lines(self) -> OutputLines:
+        try:
+            actual_output_lines = self.batch_result.actual_output_lines[self.testfile_number]
+            return actual_output_lines
+        except IndexError:
+            return tuple()  # We have already deleted temporary directory, or no output was produced due to an error.
+
+    @cached_property
+    def output_equal(self) -> bool:
+        return self.expected_output_lines == self.actual_output_lines
+
     @cached_property
     def output_diff(self) -> OutputTextDiff:
-        expected_output_lines = self.expected_output_text.splitlines()
-        actual_output_lines = self.actual_output_text.splitlines()
+        if self.temporary_directory is None or self.output_equal:
+            # We reused cached test outputs or already deleted temporary directory, output must have been the same.
+            return OutputTextDiff(blake2b().hexdigest(), tuple(), 0)
 
-        expected_output_filename = TEST_EXPECTED_OUTPUT_FILENAME_FORMAT.format(self.testfile_number)
-        actual_output_filename = TEST_ACTUAL_OUTPUT_FILENAME_FORMAT.format(self.testfile_number)
+        _, _, expected_output_filename, actual_output_filename = get_testfile_filenames(self.testfile_number)
 
         expected_output_file = self.temporary_directory / expected_output_filename
         actual_output_file = self.temporary_directory / actual_output_filename
 
         output_diff_lines = context_diff(
-            expected_output_lines, actual_output_lines, fromfile=str(expected_output_file), tofile=str(actual_output_file), lineterm='')
-        output_diff_text = '\n'.join(output_diff_lines)
-        return output_diff_text
+            self.expected_output_lines, self.actual_output_lines,
+            fromfile=str(expected_output_file), tofile=str(actual_output_file), lineterm='')
+
+        # Rather than joining the whole diff, digest it line by line and only keep the lines that we will show.
+        headless_digest = blake2b()
+        shown_lines: List[str] = []
+        num_lines = 0
+        for line_number, line in enumerate(output_diff_lines):
+            if line_number >= 2:
+                headless_digest.update(f'{line}\n'.encode())
+            if line_number < MAX_DIFF_LINES_SHOWN:
+                shown_lines.append(line)
+            num_lines += 1
+        output_diff = OutputTextDiff(headless_digest.hexdigest(), tuple(shown_lines), num_lines)
+        return output_diff
 
-    @property
-    def output_headless_diff(self) -> OutputTextHeadlessDiff:
-        output_headless_diff_lines = self.output_diff.splitlines()[2:]
-        output_headless_diff_text = '\n'.join(output_headless_diff_lines)
-        return output_headless_diff_text
-
-    @property
+    @cached_property
     def exited_successfully(self) -> bool:
         return self.exit_code == 0
 
-    @property
+    @cached_property
     def output_matches(self) -> bool:
         if self.temporary_directory is None:
             return True  # We have already deleted temporary directory, output must have been the same.
-        return not self.output_diff
+        return self.output_equal
 
     def __bool__(self) -> bool:
         return self.exited_successfully and self.output_matches
@@ -209,17 +285,32 @@ class TestResult:
     def input_text(self) -> InputText:
         return self.first_subresult.read_test_file.input_text
 
+    @cached_property
+    def subresult_statuses(self) -> Tuple[bool, bool]:
+        # Check whether all subresults exited successfully and produced expected outputs in a single pass.
+        subresults_exited_successfully, subresult_outputs_match = True, True
+        for subresult in self:
+            if subresults_exited_successfully and not subresult.exited_successfully:
+                subresults_exited_successfully = False
+            if subresult_outputs_match and not subresult.output_matches:
+                subresult_outputs_match = False
+            if not subresults_exited_successfully and not subresult_outputs_match:
+                break
+        return subresults_exited_successfully, subresult_outputs_match
+
     @property
     def subresults_succeeded(self) -> bool:
-        return all(self)
+        return self.subresults_exited_successfully and self.subresult_outputs_match
 
     @property
     def subresults_exited_successfully(self) -> bool:
-        return all(subresult.exited_successfully for subresult in self)
+        subresults_exited_successfully, _ = self.subresult_statuses
+        return subresults_exited_successfully
 
     @property
     def subresult_outputs_match(self) -> bool:
-        return all(subresult.output_matches for subresult in self)
+        _, subresult_outputs_match = self.subresult_statuses
+        return subresult_outputs_match
 
     def try_to_update_testfile(self) -> None:
         assert self.updated_testfile is None  # Make sure that we don't run this method twice
@@ -257,7 +348,7 @@ class TestResult:
     def summarize_results(results: Iterable['TestResult']) -> str:
         result_lines: List[str] = []
         result_lines.append('')
-        summaries: Dict[str, List['TestResult']] = defaultdict(lambda: list())
+        summaries: Dict[str, List['TestResult']] = defaultdict(list)
         results = list(results)
         for result in results:
             if not result:  # Exclude successful tests from the summary.
@@ -296,15 +387,17 @@ class TestResult:
         result_lines.append('')
         return '\n'.join(result_lines)
 
-    def __str__(self) -> str:
+    @cached_property
+    def subresult_summary_lines(self) -> Tuple[str, ...]:
+        # Unlike the rest of the summary, the summary of subresults doesn't depend on whether we have updated the testfile.
         result_lines: List[str] = []
         if self:
             result_lines.append('Success')
         else:
             if not self.subresults_exited_successfully:
                 result_lines.append('Some commands produced non-zero exit codes:')
-                exit_codes: Dict[int, List[TestSubResult]] = defaultdict(lambda: list())
-                commands: Dict[Command, Set[int]] = defaultdict(lambda: set())
+                exit_codes: Dict[int, List[TestSubResult]] = defaultdict(list)
+                commands: Dict[Command, Set[int]] = defaultdict(set)
                 for subresult in self:
                     exit_codes[subresult.exit_code].append(subresult)
                     commands[subresult.test_parameters.command].add(subresult.exit_code)
@@ -327,12 +420,17 @@ class TestResult:
                 result_lines.append('')
             if not self.subresult_outputs_match:
                 result_lines.append('Some commands produced unexpected outputs:')
-                headless_diffs: Dict[OutputTextHeadlessDiff, List[TestSubResult]] = defaultdict(lambda: list())
-                commands: Dict[Command, Set[OutputTextHeadlessDiff]] = defaultdict(lambda: set())
+                # All subresults share the expected output, so we group them by actual outputs and only produce one diff per group.
+                actual_outputs: Dict[Optional[OutputLines], List[TestSubResult]] = defaultdict(list)
+                commands: Dict[Command, Set[Optional[OutputLines]]] = defaultdict(set)
                 for subresult in self:
-                    headless_diffs[subresult.output_headless_diff].append(subresult)
-                    commands[subresult.test_parameters.command].add(subresult.output_headless_diff)
-                for _, subresults in sorted(headless_diffs.items(), key=lambda x: x[0]):
+                    actual_output_lines = None if subresult.output_matches else subresult.actual_output_lines
+                    actual_outputs[actual_output_lines].append(subresult)
+                    commands[subresult.test_parameters.command].add(actual_output_lines)
+                for subresults in sorted(
+                    actual_outputs.values(),
+                    key=lambda x: (x[0].output_diff.shown_lines[2:], x[0].output_diff.headless_digest),
+                ):
                     commands_with_templates = sorted(set(
                         (
                             command := subresult.test_parameters.command,
@@ -349,11 +447,20 @@ class TestResult:
                     else:
                         result_lines.append(f'- Command{plural} {command_texts} produced unexpected output with the following diff:')
                         result_lines.append('')
-                        for line in first_subresult.output_diff.splitlines():
+                        output_diff = first_subresult.output_diff
+                        for line in output_diff.shown_lines:
                             result_lines.append(f'  {line}')
+                        if output_diff.num_lines > len(output_diff.shown_lines):
+                            num_hidden_lines = output_diff.num_lines - len(output_diff.shown_lines)
+                            plural = 's' if num_hidden_lines > 1 else ''
+                            result_lines.append(f'  and {num_hidden_lines} more line{plural}')
                         result_lines.append('')
                 if result_lines[-1]:  # Make sure that we don't produce double blank lines in the output.
                     result_lines.append('')
+        return tuple(result_lines)
+
+    def __str__(self) -> str:
+        result_lines: List[str] = list(self.subresult_summary_lines)
         if self.updated_testfile is not None:
             if self.updated_testfile:
                 result_lines.append('We successfully updated the testfile.')
@@ -374,17 +481,23 @@ class TestResult:
 
 
 class BatchResult:
-    def __init__(self, testfile_batch: TestFileBatch, test_parameters: TestParameters, temporary_directory: Path,
-                 test_process: CompletedProcess, fail_fast: bool) -> None:
+    def __init__(self, testfile_batch: TestFileBatch, test_parameters: TestParameters, temporary_directory: Optional[Path],
+                 test_process: CompletedProcess, fail_fast: bool, use_cache: bool, batch_output_text: Optional[OutputText] = None,
+                 cached_actual_output_texts: Optional[Tuple[OutputText, ...]] = None) -> None:
         self.testfile_batch = testfile_batch
         assert len(self) >= 1
         self.test_parameters = test_parameters
         self.temporary_directory = temporary_directory
         self.exit_code = test_process.returncode
         self.fail_fast = fail_fast
+        self.use_cache = use_cache
+        self.batch_output_text = batch_output_text
+        if cached_actual_output_texts is not None:
+            assert temporary_directory is None  # Cached test outputs are only used if we didn't run the test.
+            self.actual_output_texts = cached_actual_output_texts
 
         # If test succeeded, remove temporary directory.
-        if self:
+        if self and self.temporary_directory is not None:
             rmtree(self.temporary_directory)
             self.temporary_directory = None
 
@@ -408,13 +521,13 @@ class BatchResult:
             first_test_parameters = TestParameters(first_read_testfile_results, *remaining_parameters)
             second_test_parameters = TestParameters(second_read_testfile_results, *remaining_parameters)
             first_subresults = self.__class__.run_test_batch_with_parameters(
-                first_testfile_subbatch, first_test_parameters, self.fail_fast)
+                first_testfile_subbatch, first_test_parameters, self.fail_fast, self.use_cache)
             if self.fail_fast and not all(first_subresults):
                 second_subresults = [TestSubResult(self, testfile_number) for testfile_number in range(pivot, len(self))]
             else:
                 LOGGER.warning(f'- Second subbatch: {format_testfiles(second_testfile_subbatch)}')
                 second_subresults = self.__class__.run_test_batch_with_parameters(
-                    second_testfile_subbatch, second_test_parameters, self.fail_fast)
+                    second_testfile_subbatch, second_test_parameters, self.fail_fast, self.use_cache)
             subresult_list = list(chain(first_subresults, second_subresults))
         else:  # If some testfiles did not produce output and the batch contains a single testfile, return the result.
             testfile_number = 0
@@ -426,22 +539,23 @@ class BatchResult:
 
     @cached_property
     def actual_output_texts(self) -> Tuple[OutputText, ...]:
-        try:
-            actual_output_file = self.temporary_directory / TEST_ACTUAL_OUTPUT_FILENAME
-            with actual_output_file.open('rt') as f:
-                actual_output_text = f.read()
-            actual_output_texts = split_batch_output_text(actual_output_text)
-            actual_output_texts = tuple(actual_output_texts)
-            for actual_output_text_number, actual_output_text in enumerate(actual_output_texts):
-                actual_output_filename = TEST_ACTUAL_OUTPUT_FILENAME_FORMAT.format(actual_output_text_number)
-                actual_output_file = self.temporary_directory / actual_output_filename
-                with actual_output_file.open('wt') as f:
-                    for line in actual_output_text.splitlines():
-                        print(line, file=f)
-            assert len(actual_output_texts) <= len(self)
-            return actual_output_texts
-        except IOError:
+        if self.temporary_directory is None or self.batch_output_text is None:
             return tuple()  # We have already deleted temporary directory, or no output was produced due to an error.
+        actual_output_texts = split_batch_output_text(self.batch_output_text)
+        actual_output_texts = tuple(actual_output_texts)
+        for actual_output_text_number, actual_output_text in enumerate(actual_output_texts):
+            actual_output_filename = get_testfile_filenames(actual_output_text_number).actual_output_filename
+            actual_output_file = self.temporary_directory / actual_output_filename
+            with actual_output_file.open('wt') as f:
+                print(actual_output_text, file=f)
+        assert len(actual_output_texts) <= len(self)
+        self.batch_output_text = None  # Release the batch output, which we have just split into the test outputs.
+        return actual_output_texts
+
+    @cached_property
+    def actual_output_lines(self) -> Tuple[OutputLines, ...]:
+        actual_output_lines = tuple(tuple(actual_output_text.splitlines()) for actual_output_text in self.actual_output_texts)
+        return actual_output_lines
 
     def __len__(self) -> int:
         return len(self.testfile_batch)
@@ -452,86 +566,114 @@ class BatchResult:
     def __bool__(self) -> bool:
         return all(self)
 
+    def __getstate__(self) -> Dict[str, Any]:
+        # Don't send the split lines of test outputs from worker processes, the parent process can split them again.
+        state = self.__dict__.copy()
+        state.pop('actual_output_lines', None)
+        return state
+
     @classmethod
     def run_test_batch_with_parameters(cls, testfile_batch: TestFileBatch, test_parameters: TestParameters,
-                                       fail_fast: bool) -> 'BatchResult':
+                                       fail_fast: bool, use_cache: bool) -> 'BatchResult':
         assert len(testfile_batch) >= 1
         read_testfile_results, tex_format, template, command = test_parameters
 
+        # If all testfiles produced expected outputs in a previous run, reuse the cached test outputs.
+        test_cache_files = [
+            get_test_cache_file(read_testfile_result, template, command)
+            for read_testfile_result
+            in read_testfile_results
+        ]
+        cached_actual_output_texts = read_test_cache_files(test_cache_files) if use_cache else None
+        if cached_actual_output_texts is not None and all(
+            tuple(actual_output_text.splitlines()) == read_testfile_result.expected_output_lines
+            for actual_output_text, read_testfile_result
+            in zip_equal(cached_actual_output_texts, read_testfile_results)
+        ):
+            test_process = CompletedProcess(command, 0)
+            batch_result = BatchResult(testfile_batch, test_parameters, None, test_process, fail_fast, use_cache,
+                                       cached_actual_output_texts=cached_actual_output_texts)
+            return batch_result
+
         # Create a temporary directory.
         temporary_directory = Path(mkdtemp())
 
-        # Copy support files.
-        for support_file in SUPPORT_DIRECTORY.glob('*'):
-            copyfile(support_file, temporary_directory / support_file.name)
+        # Link support files.
+        copytree(get_support_prototype_directory(), temporary_directory, copy_function=link_or_copy_file, dirs_exist_ok=True)
 
         # Create test file.
         test_texts: List[str] = []
 
         # Create test file fragment with header.
-        with (template / TEMPLATE_HEAD_FILENAME).open('rt') as f:
-            head_text = f.read()
+        head_text = read_template_file(template / TEMPLATE_HEAD_FILENAME)
         test_texts.append(head_text)
 
+        # Create testfile-specific support files.
+        support_texts: List[Tuple[Path, str]] = []
         for testfile_number, (testfile, read_testfile_result) in enumerate(zip_equal(testfile_batch, read_testfile_results)):
-            _, setup_text, input_text, expected_output_text = read_testfile_result
+            _, setup_text, input_text, expected_output_text, _ = read_testfile_result
 
-            test_setup_filename = TEST_SETUP_FILENAME_FORMAT.format(testfile_number)
-            test_input_filename = TEST_INPUT_FILENAME_FORMAT.format(testfile_number)
-            test_expected_output_filename = TEST_EXPECTED_OUTPUT_FILENAME_FORMAT.format(testfile_number)
+            test_setup_filename, test_input_filename, test_expected_output_filename, _ = get_testfile_filenames(testfile_number)
 
-            # Create testfile-specific support files.
-            with (temporary_directory / test_setup_filename).open('wt') as f:
-                print(setup_text, file=f, end='')
+            support_texts.append((temporary_directory / test_setup_filename, setup_text))
+            support_texts.append((temporary_directory / test_input_filename, input_text))
+            support_texts.append((temporary_directory / test_expected_output_filename, expected_output_text))
 
-            with (temporary_directory / test_input_filename).open('wt') as f:
-                print(input_text, file=f, end='')
+        for support_file, support_text in support_texts:
+            support_file.write_text(support_text)
 
-            with (temporary_directory / test_expected_output_filename).open('wt') as f:
-                print(expected_output_text, file=f, end='')
-
-            # Create testfile-specific test file fragments.
-            body_text = run_m4(
-                template / TEMPLATE_BODY_FILENAME,
-                cwd=temporary_directory,
-                TEST_SETUP_FILENAME=test_setup_filename,
-                TEST_INPUT_FILENAME=test_input_filename)
-            test_texts.append(body_text)
+        # Create testfile-specific test file fragments.
+        body_texts = expand_body_templates(template, temporary_directory, read_testfile_results)
+        test_texts.extend(body_texts)
 
         # Create test file fragment with footer.
-        with (template / TEMPLATE_FOOT_FILENAME).open('rt') as f:
-            foot_text = f.read()
+        foot_text = read_template_file(template / TEMPLATE_FOOT_FILENAME)
         test_texts.append(foot_text)
 
         test_text = '\n'.join(test_text.strip('\r\n') for test_text in test_texts)
         with (temporary_directory / TEST_FILENAME).open('wt') as f:
             print(test_text, file=f)
 
-        # Run test.
-        test_process = run(command, cwd=temporary_directory, capture_output=True)
+        # Run test. TeX also writes its standard output to the log file, so we discard it and only keep the error output.
+        test_process = run(command, cwd=temporary_directory, stdout=DEVNULL, stderr=PIPE, text=True, errors='ignore')
+        if test_process.stderr:
+            LOGGER.debug(f'Command {format_command(command)} produced error output: {test_process.stderr.rstrip()}')
 
-        # Extract test output.
+        # Extract test output. We keep it in memory, so that we don't need to read it back from the temporary directory.
+        batch_output_text: Optional[OutputText] = None
         try:
             actual_output_file = temporary_directory / TEST_OUTPUT_FILENAME
-            actual_output_text = read_test_output_from_tex_log_file(actual_output_file)
+            batch_output_text = read_test_output_from_tex_log_file(actual_output_file)
             with (temporary_directory / TEST_ACTUAL_OUTPUT_FILENAME).open('wt') as f:
-                print(actual_output_text, file=f)
+                print(batch_output_text, file=f)
         except IOError as e:
             LOGGER.debug(f'Failed to extract test output from log file: {e}.')
 
         # Store test batch result.
-        batch_result = BatchResult(testfile_batch, test_parameters, temporary_directory, test_process, fail_fast)
+        batch_result = BatchResult(
+            testfile_batch, test_parameters, temporary_directory, test_process, fail_fast, use_cache, batch_output_text)
+
+        # If all testfiles produced output without errors, cache the test outputs.
+        if batch_result.exit_code == 0 and len(batch_result.actual_output_texts) == len(batch_result):
+            for test_cache_file, actual_output_text in zip_equal(test_cache_files, batch_result.actual_output_texts):
+                if test_cache_file is None:
+                    continue
+                try:
+                    write_file_atomically(test_cache_file, actual_output_text)
+                except OSError as e:
+                    LOGGER.debug(f'Failed to write test cache file {test_cache_file}: {e}.')
+
         return batch_result
 
     @classmethod
-    def run_test_batch(cls, args: Tuple[TestFileBatch, bool]) -> List[Optional[TestResult]]:
-        testfile_batch, fail_fast = args
+    def run_test_batch(cls, args: Tuple[TestFileBatch, bool, bool]) -> List[Optional[TestResult]]:
+        testfile_batch, fail_fast, use_cache = args
 
         # Run the test for all different test parameters.
-        all_subresults: Dict[TestFile, List[TestSubResult]] = defaultdict(lambda: list())
+        all_subresults: Dict[TestFile, List[TestSubResult]] = defaultdict(list)
         for test_parameters, filtered_testfile_batch in get_test_parameters(testfile_batch):
             assert len(filtered_testfile_batch) >= 1
-            batch_result = cls.run_test_batch_with_parameters(filtered_testfile_batch, test_parameters, fail_fast)
+            batch_result = cls.run_test_batch_with_parameters(filtered_testfile_batch, test_parameters, fail_fast, use_cache)
             for subresult in batch_result.subresults:
                 all_subresults[subresult.testfile].append(subresult)
             if fail_fast and not batch_result:  # If we want to fail fast, stop after the first failed command.
@@ -551,29 +693,173 @@ class BatchResult:
 
 @cache
 def get_tex_formats() -> Tuple[TeXFormat, ...]:
-    tex_formats: List[TeXFormat] = []
-    for tex_format_path in TEMPLATE_DIRECTORY.glob('*/'):
-        tex_formats.append(tex_format_path.name)
+    tex_formats: Iterable[TeXFormat] = get_template_metadata().keys()
     return tuple(sorted(tex_formats))
 
 
 @cache
 def get_templates(tex_format: str) -> Tuple[Template, ...]:
-    templates: Iterable[Template] = (TEMPLATE_DIRECTORY / tex_format).glob('*/')
-    return tuple(sorted(templates))
+    templates = get_template_metadata()[tex_format].templates
+    return templates
+
+
+@cache
+def get_commands(tex_format: str) -> Tuple[Command, ...]:
+    commands = get_template_metadata()[tex_format].commands
+    return commands
+
+
+@cache
+def get_template_metadata() -> TemplateMetadata:
+    # Reuse TeX formats, templates, and commands from previous runs unless the template directory has changed.
+    template_directory_digest = get_template_directory_digest()
+    template_metadata = read_template_cache_file(template_directory_digest)
+    if template_metadata is None:
+        template_metadata = dict()
+        for tex_format_path in TEMPLATE_DIRECTORY.glob('*/'):
+            tex_format = tex_format_path.name
+            templates: Tuple[Template, ...] = tuple(sorted((TEMPLATE_DIRECTORY / tex_format).glob('*/')))
+            commands = read_commands(tex_format) if templates else tuple()
+            template_metadata[tex_format] = TeXFormatMetadata(templates, commands)
+        write_template_cache_file(template_directory_digest, template_metadata)
+    return template_metadata
+
+
+def get_template_directory_digest() -> str:
+    digest = blake2b()
+    digest.update(f'{TEST_FILENAME}\0'.encode())
+    for path in chain([TEMPLATE_DIRECTORY], sorted(TEMPLATE_DIRECTORY.rglob('*'))):
+        path_stat = path.stat()
+        digest.update(f'{path}\0{path_stat.st_mtime_ns}\0{path_stat.st_size}\0'.encode())
+    return digest.hexdigest()
+
+
+def read_template_cache_file(template_directory_digest: str) -> Optional[TemplateMetadata]:
+    if TEMPLATE_CACHE_FILE is None:
+        return None
+    try:
+        with TEMPLATE_CACHE_FILE.open('rt') as f:
+            template_cache = json.load(f)
+        if template_cache['digest'] != template_directory_digest:
+            return None
+        template_metadata: TemplateMetadata = dict()
+        for tex_format, tex_format_metadata in template_cache['tex_formats'].items():
+            templates = tuple(Path(template) for template in tex_format_metadata['templates'])
+            commands = tuple(tuple(command) for command in tex_format_metadata['commands'])
+            template_metadata[tex_format] = TeXFormatMetadata(templates, commands)
+        return template_metadata
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:  # The template cache file is unreadable or malformed.
+        LOGGER.debug(f'Failed to read template cache file {TEMPLATE_CACHE_FILE}: {e}.')
+        return None
+
+
+def write_template_cache_file(template_directory_digest: str, template_metadata: TemplateMetadata) -> None:
+    if TEMPLATE_CACHE_FILE is None:
+        return
+    template_cache = {
+        'digest': template_directory_digest,
+        'tex_formats': {
+            tex_format: {
+                'templates': [str(template) for template in tex_format_metadata.templates],
+                'commands': [list(command) for command in tex_format_metadata.commands],
+            }
+            for tex_format, tex_format_metadata
+            in template_metadata.items()
+        },
+    }
+    template_cache_text = json.dumps(template_cache, indent=2)
+    try:
+        write_file_atomically(TEMPLATE_CACHE_FILE, f'{template_cache_text}\n')
+    except OSError as e:
+        LOGGER.debug(f'Failed to write template cache file {TEMPLATE_CACHE_FILE}: {e}.')
+
+
+@cache
+def get_support_prototype_directory() -> Path:
+    # The prototype directory is created before we start worker processes, so that forked worker processes inherit it.
+    # Since TeX only reads the support files, temporary directories can hardlink them from the prototype directory.
+    prototype_directory = Path(mkdtemp())
+    # Unlike `atexit`, finalizers also run when worker processes exit. Each finalizer only runs in the process that created it.
+    Finalize(None, rmtree, args=(prototype_directory,), kwargs={'ignore_errors': True}, exitpriority=0)
+    for support_file in SUPPORT_DIRECTORY.glob('*'):
+        prototype_file = prototype_directory / support_file.name
+        copyfile(support_file, prototype_file)
+        prototype_file.chmod(0o444)  # Make sure that tests can't accidentally modify support files of other tests.
+    return prototype_directory
+
+
+def link_or_copy_file(source_file: str, destination_file: str) -> None:
+    try:
+        os.link(source_file, destination_file)
+    except OSError:  # The filesystem does not support hardlinks.
+        copyfile(source_file, destination_file)
+
+
+@cache
+def get_testfile_filenames(testfile_number: int) -> TestFileFilenames:
+    # Batches reuse the same few testfile numbers, so we only format the filenames for each number once.
+    testfile_filenames = TestFileFilenames(
+        TEST_SETUP_FILENAME_FORMAT.format(testfile_number),
+        TEST_INPUT_FILENAME_FORMAT.format(testfile_number),
+        TEST_EXPECTED_OUTPUT_FILENAME_FORMAT.format(testfile_number),
+        TEST_ACTUAL_OUTPUT_FILENAME_FORMAT.format(testfile_number))
+    return testfile_filenames
+
+
+@cache
+def read_template_file(template_file: Path) -> str:
+    with template_file.open('rt') as f:
+        template_text = f.read()
+    return template_text
 
 
 def run_m4(input_file: Path, cwd: Optional[Path] = None, **variables) -> str:
     with input_file.open('rt') as f:
         input_text = f.read()
+    output_text = run_m4_on_text(input_text, cwd, **variables)
+    return output_text
+
+
+def run_m4_on_text(input_text: str, cwd: Optional[Path] = None, **variables) -> str:
     m4_parameters = [f'-D{key}={value}' for key, value in variables.items()]
     m4_process = run(['m4', *m4_parameters], text=True, input=input_text, check=True, capture_output=True, cwd=cwd)
     output_text = m4_process.stdout
     return output_text
 
 
-@cache
-def get_commands(tex_format: str) -> Tuple[Command, ...]:
+def expand_body_templates(template: Template, cwd: Path, read_testfile_results: ReadTestFiles) -> List[str]:
+    # Besides the macro definitions, the output of m4 only depends on the test markdown source code, which some
+    # templates include with `undivert(TEST_INPUT_FILENAME)`. Therefore, we can reuse the output across commands,
+    # templates with the same body, and bisected batches, regardless of the temporary directory.
+    body_template_text = read_template_file(template / TEMPLATE_BODY_FILENAME)
+    cache_keys: List[BodyTextCacheKey] = []
+    for testfile_number, read_testfile_result in enumerate(read_testfile_results):
+        test_setup_filename, test_input_filename, _, _ = get_testfile_filenames(testfile_number)
+        cache_key = (body_template_text, test_setup_filename, test_input_filename, read_testfile_result.input_text)
+        cache_keys.append(cache_key)
+
+    # Expand all uncached body templates in a single run of m4, separating them with a line that we split at afterwards.
+    uncached_cache_keys = [cache_key for cache_key in cache_keys if cache_key not in BODY_TEXT_CACHE]
+    if uncached_cache_keys:
+        input_texts: List[str] = []
+        for _, test_setup_filename, test_input_filename, _ in uncached_cache_keys:
+            input_texts.append(f'{TEMPLATE_BODY_SEPARATOR}\n')
+            input_texts.append(f"define(`TEST_SETUP_FILENAME', `{test_setup_filename}')dnl\n")
+            input_texts.append(f"define(`TEST_INPUT_FILENAME', `{test_input_filename}')dnl\n")
+            input_texts.append(body_template_text)
+        output_text = run_m4_on_text(''.join(input_texts), cwd=cwd)
+        leading_text, *body_texts = output_text.split(f'{TEMPLATE_BODY_SEPARATOR}\n')
+        assert not leading_text
+        for cache_key, body_text in zip_equal(uncached_cache_keys, body_texts):
+            BODY_TEXT_CACHE[cache_key] = body_text
+
+    body_texts = [BODY_TEXT_CACHE[cache_key] for cache_key in cache_keys]
+    return body_texts
+
+
+def read_commands(tex_format: str) -> Tuple[Command, ...]:
     commands: List[Command] = []
     commands_file = TEMPLATE_DIRECTORY / tex_format / COMMANDS_FILENAME
     commands_text = run_m4(commands_file, TEST_FILENAME=TEST_FILENAME)
@@ -585,74 +871,138 @@ def get_commands(tex_format: str) -> Tuple[Command, ...]:
     return tuple(commands)
 
 
+@cache
+def get_environment_digest(command: Command) -> Optional[str]:
+    # Fingerprint the TeX engine, the installed Markdown package, and the support files, so that cached test outputs
+    # are invalidated whenever any of them changes.
+    digest = blake2b()
+    try:
+        version_process = run([command[0], '--version'], capture_output=True)
+        kpsewhich_process = run(['kpsewhich', *PACKAGE_FILENAMES], capture_output=True, text=True)
+    except OSError as e:
+        LOGGER.debug(f'Not caching test outputs for command {format_command(command)}: {e}.')
+        return None
+    digest.update(version_process.stdout)
+    package_files = [Path(package_filename) for package_filename in kpsewhich_process.stdout.splitlines()]
+    support_files = sorted(SUPPORT_DIRECTORY.glob('*'))
+    for input_file in chain(package_files, support_files):
+        digest.update(input_file.name.encode())
+        digest.update(input_file.read_bytes())
+    return digest.hexdigest()
+
+
+@cache
+def get_test_cache_file(read_testfile_result: ReadTestFile, template: Template, command: Command) -> Optional[Path]:
+    # Testfiles are only read once, so cache lookups compare the texts of the same testfile by identity, which is fast.
+    # This way, bisected batches don't need to digest their testfiles again.
+    if TEST_CACHE_DIRECTORY is None:
+        return None
+    environment_digest = get_environment_digest(command)
+    if environment_digest is None:
+        return None
+    digest = blake2b()
+    input_texts = [
+        environment_digest,
+        str(template),
+        read_template_file(template / TEMPLATE_HEAD_FILENAME),
+        read_template_file(template / TEMPLATE_BODY_FILENAME),
+        read_template_file(template / TEMPLATE_FOOT_FILENAME),
+        *command,
+        read_testfile_result.setup_text,
+        read_testfile_result.input_text,
+    ]
+    for input_text in input_texts:
+        digest.update(input_text.encode())
+        digest.update(b'\0')
+    test_cache_filename = TEST_CACHE_FILENAME_FORMAT.format(digest.hexdigest())
+    test_cache_file = TEST_CACHE_DIRECTORY / test_cache_filename
+    return test_cache_file
+
+
+def read_test_cache_files(test_cache_files: Iterable[Optional[Path]]) -> Optional[Tuple[OutputText, ...]]:
+    actual_output_texts: List[OutputText] = []
+    for test_cache_file in test_cache_files:
+        if test_cache_file is None:
+            return None
+        try:
+            with test_cache_file.open('rt') as f:
+                actual_output_text = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:  # The test cache file is unreadable or malformed.
+            LOGGER.debug(f'Failed to read test cache file {test_cache_file}: {e}.')
+            return None
+        actual_output_texts.append(actual_output_text)
+    return tuple(actual_output_texts)
+
+
+def write_file_atomically(output_file: Path, output_text: str) -> None:
+    # Write to a process-specific file first, so that other processes never read partially written files.
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    temporary_output_file = output_file.with_name(f'{output_file.name}.{os.getpid()}')
+    with temporary_output_file.open('wt') as f:
+        print(output_text, file=f, end='')
+    temporary_output_file.replace(output_file)
+
+
 def read_testfile(testfile: TestFile) -> ReadTestFile:
-    input_lines: Dict[str, List] = defaultdict(lambda: list())
-    input_part = 'setup'
+    # Key the cache on the modification time and the size of the testfile, so that updated testfiles are reread.
+    testfile_stat = testfile.stat()
+    read_testfile_result = read_testfile_with_cache(testfile, testfile_stat.st_mtime_ns, testfile_stat.st_size)
+    return read_testfile_result
+
+
+@cache
+def read_testfile_with_cache(testfile: TestFile, mtime_ns: int, size: int) -> ReadTestFile:
     with testfile.open('rt') as f:
-        for line in f:
-            if input_part == 'setup' and line.strip() == '<<<':
-                input_part = 'input'
-            elif input_part == 'input' and line.strip() == '>>>':
-                input_part = 'expected_output'
-            else:
-                input_lines[input_part].append(line)
+        testfile_text = f.read()
+
+    # Split the testfile at the first line with `<<<` and at the first following line with `>>>`.
+    setup_text, input_text, expected_output_text = testfile_text, '', ''
+    input_delimiter_match = INPUT_DELIMITER_REGEX.search(testfile_text)
+    if input_delimiter_match is not None:
+        setup_text = testfile_text[:input_delimiter_match.start()]
+        input_text = testfile_text[input_delimiter_match.end() + 1:]
+        expected_output_delimiter_match = EXPECTED_OUTPUT_DELIMITER_REGEX.search(input_text)
+        if expected_output_delimiter_match is not None:
+            expected_output_text = input_text[expected_output_delimiter_match.end() + 1:]
+            input_text = input_text[:expected_output_delimiter_match.start()]
 
     # Read optional YAML metadata.
-    stripped_setup_input_lines = [input_line.strip() for input_line in input_lines['setup']]
-    if '---' in stripped_setup_input_lines:
-        yaml_delimiter_index = stripped_setup_input_lines.index('---')
-        yaml_text = ''.join(input_lines['setup'][:yaml_delimiter_index])
-        setup_text = ''.join(input_lines['setup'][yaml_delimiter_index + 1:])
-    else:
-        yaml_text = ''
-        setup_text = ''.join(input_lines['setup'])
+    yaml_text = ''
+    yaml_delimiter_match = YAML_DELIMITER_REGEX.search(setup_text)
+    if yaml_delimiter_match is not None:
+        yaml_text = setup_text[:yaml_delimiter_match.start()]
+        setup_text = setup_text[yaml_delimiter_match.end() + 1:]
 
-    # Read mandatory parts of the testfile.
-    input_text = ''.join(input_lines['input'])
-    expected_output_text = ''.join(input_lines['expected_output'])
+    # Make sure that the expected output ends with a newline.
     if expected_output_text and not expected_output_text.endswith('\n'):
         expected_output_text = f'{expected_output_text}\n'
 
-    return ReadTestFile(yaml_text, setup_text, input_text, expected_output_text)
+    expected_output_lines = tuple(expected_output_text.splitlines())
+
+    return ReadTestFile(yaml_text, setup_text, input_text, expected_output_text, expected_output_lines)
 
 
 def read_test_output_from_tex_log_file(tex_log_file: Path) -> OutputText:
-    input_lines: List[str] = []
-    input_line_fragments: List[str] = []
-    in_test_output = False
     with tex_log_file.open('rt', errors='ignore') as f:
-        for line in f:
-            line = line.rstrip('\r\n')
-            if not in_test_output and line.strip() == 'TEST INPUT BEGIN':
-                in_test_output = True
-            elif in_test_output and line.strip() == 'TEST INPUT END':
-                input_line = ''.join(input_line_fragments)
-                input_line = f'{input_line}\n'
-                input_lines.append(input_line)
-                input_line_fragments.clear()
-                in_test_output = False
-            elif in_test_output:
-                input_line_fragments.append(line)
+        tex_log_text = f.read()
+
+    # TeX wraps long lines in the log file, so we join the lines of each test output back together.
+    input_lines: List[str] = []
+    for input_line_fragments in TEST_OUTPUT_REGEX.findall(tex_log_text):
+        input_line = input_line_fragments.replace('\n', '')
+        input_line = f'{input_line}\n'
+        input_lines.append(input_line)
 
     output_text = ''.join(input_lines)
     return output_text
 
 
 def split_batch_output_text(output_text: OutputText) -> Iterable[OutputText]:
-    input_lines: List[str] = []
-    in_test_output = False
-    for line in output_text.splitlines():
-        if not in_test_output and line.strip() == 'BEGIN document':
-            in_test_output = True
-            input_lines.append(line)
-        elif in_test_output and line.strip() == 'END document':
-            input_lines.append(line)
-            output_text = '\n'.join(input_lines)
-            input_lines.clear()
-            yield output_text
-            in_test_output = False
-        elif in_test_output:
-            input_lines.append(line)
+    output_text = '\n'.join(output_text.splitlines())
+    for match in DOCUMENT_OUTPUT_REGEX.finditer(output_text):
+        yield match.group(0)
 
 
 def format_commands_with_templates(commands_with_templates: Iterable[Tuple[Command, Optional[Template]]]) -> str:
@@ -763,7 +1113,32 @@ def get_test_parameters(testfile_batch: TestFileBatch) -> Iterable[Tuple[TestPar
                     yield filtered_test_parameters, filtered_testfile_batch
 
 
-def run_tests(testfiles: Iterable[TestFile], fail_fast: bool) -> Iterable[Optional[TestResult]]:
+def populate_caches() -> None:
+    for tex_format in get_tex_formats():
+        get_templates(tex_format)
+        get_commands(tex_format)
+    get_support_prototype_directory()
+
+
+@cache
+def get_process_pool() -> Pool:
+    # Prefer forking, so that worker processes inherit caches populated before the pool is created, including the
+    # prototype directory with support files. Otherwise, worker processes populate their caches at startup.
+    populate_caches()
+    start_method = 'fork' if 'fork' in get_all_start_methods() else None
+    context = get_context(start_method)
+    pool = context.Pool(NUM_PROCESSES, initializer=populate_caches, maxtasksperchild=MAX_TASKS_PER_CHILD)
+    # At exit, close the pool rather than terminate it, so that worker processes run their finalizers.
+    Finalize(pool, close_process_pool, args=(pool,), exitpriority=16)
+    return pool
+
+
+def close_process_pool(pool: Pool) -> None:
+    pool.close()
+    pool.join()
+
+
+def run_tests(testfiles: Iterable[TestFile], fail_fast: bool, use_cache: bool) -> Iterable[Optional[TestResult]]:
     testfiles: List[TestFile] = list(testfiles)
 
     def get_all_results() -> Iterable[Iterable[TestResult]]:
@@ -771,7 +1146,7 @@ def run_tests(testfiles: Iterable[TestFile], fail_fast: bool) -> Iterable[Option
             # Populate caches by running the first testfile sequentially.
             first_testfile, *remaining_testfiles = testfiles
             first_testfile_batch: List[TestFileBatch] = [[first_testfile]]
-            first_batch = zip(first_testfile_batch, repeat(fail_fast))
+            first_batch = zip(first_testfile_batch, repeat(fail_fast), repeat(use_cache))
             sequential_results = map(BatchResult.run_test_batch, first_batch)
 
             # Run the remaining batches in parallel.
@@ -788,14 +1163,26 @@ def run_tests(testfiles: Iterable[TestFile], fail_fast: bool) -> Iterable[Option
                         LOGGER.debug(f'Reducing batch size to {updated_testfile_batch_size} to fully utilize {NUM_PROCESSES} hyperthreads.')
                     testfile_batch_size, num_batches = updated_testfile_batch_size, updated_num_batches
                 remaining_testfile_batches: List[TestFileBatch] = list(chunked(remaining_testfiles, testfile_batch_size))
-                remaining_batches = zip(remaining_testfile_batches, repeat(fail_fast))
+                remaining_batches = zip(remaining_testfile_batches, repeat(fail_fast), repeat(use_cache))
                 assert len(remaining_testfile_batches) == num_batches
                 LOGGER.debug(f'The testfiles break down into {num_batches} batches.')
+                if num_batches <= MAX_NUM_SEQUENTIAL_BATCHES:
+                    # If there are too few batches to benefit from parallelization, run them sequentially.
+                    LOGGER.debug('Running the batches sequentially.')
+                    remaining_results = map(BatchResult.run_test_batch, remaining_batches)
+                    all_results = chain(sequential_results, remaining_results)
+                    yield from all_results
+                    return
                 sequential_results = list(sequential_results)  # Materialize the results for the first testfile before we parallelize.
-                with Pool(NUM_PROCESSES) as pool:
-                    parallel_results = pool.imap(BatchResult.run_test_batch, remaining_batches, chunksize=1)
-                    all_results = chain(sequential_results, parallel_results)
+                pool = get_process_pool()
+                parallel_results = pool.imap(BatchResult.run_test_batch, remaining_batches, chunksize=1)
+                all_results = chain(sequential_results, parallel_results)
+                try:
                     yield from all_results
+                except BaseException:  # If we stopped early, stop the remaining batches and don't reuse the pool.
+                    pool.terminate()
+                    get_process_pool.cache_clear()
+                    raise
             else:
                 yield from sequential_results
         # If there is just a single hyperthread, run all batches sequentially.
@@ -803,7 +1190,7 @@ def run_tests(testfiles: Iterable[TestFile], fail_fast: bool) -> Iterable[Option
             testfile_batch_size = int(ceil(len(testfiles) / MIN_NUM_BATCHES))
             LOGGER.debug(f'Using batch size {testfile_batch_size}.')
             testfile_batches: Iterable[TestFileBatch] = chunked(testfiles, testfile_batch_size)
-            all_batches = zip(testfile_batches, repeat(fail_fast))
+            all_batches = zip(testfile_batches, repeat(fail_fast), repeat(use_cache))
             all_results = map(BatchResult.run_test_batch, all_batches)
             yield from all_results
 
@@ -825,7 +1212,11 @@ def run_tests(testfiles: Iterable[TestFile], fail_fast: bool) -> Iterable[Option
               help='When a test fails, stop immediately',
               is_flag=True,
               default=None)
-def main(testfiles: Iterable[str], update_tests: Optional[bool], fail_fast: Optional[bool]) -> None:
+@click.option('--cache/--no-cache', 'use_cache',
+              help='Reuse outputs of tests that succeeded in previous runs',
+              is_flag=True,
+              default=None)
+def main(testfiles: Iterable[str], update_tests: Optional[bool], fail_fast: Optional[bool], use_cache: Optional[bool]) -> None:
 
     # Process options.
     if update_tests is None:
@@ -834,6 +1225,8 @@ def main(testfiles: Iterable[str], update_tests: Optional[bool], fail_fast: Opti
         fail_fast = False if update_tests else FAIL_FAST
     if update_tests and fail_fast:
         raise ValueError('Options --fail-fast and --update-tests are mutually exclusive')
+    if use_cache is None:
+        use_cache = USE_CACHE
 
     # Print information about the run.
     testfiles: List[TestFile] = sorted(map(Path, testfiles), key=modified_first_sort_key if fail_fast else None)
@@ -848,10 +1241,13 @@ def main(testfiles: Iterable[str], update_tests: Optional[bool], fail_fast: Opti
     else:
         LOGGER.info('Will run all tests despite errors.')
 
+    if not use_cache:
+        LOGGER.info('Will rerun tests that succeeded in previous runs.')
+
     # Run tests.
     some_tests_failed = False
     results: List[TestResult] = []
-    result_iter = run_tests(testfiles, fail_fast)
+    result_iter = run_tests(testfiles, fail_fast, use_cache)
     show_progress_bar = LOG_LEVEL >= logging.INFO
     progress_bar = tqdm(result_iter, total=len(testfiles), disable=not show_progress_bar)
     for result in progress_bar: